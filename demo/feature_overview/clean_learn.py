@@ -3,11 +3,13 @@ The Cleanlearn What-If Analysis for the running example
 """
 # pylint: disable-all
 import dataclasses
+import weakref
 from enum import Enum
-from functools import partial
-from typing import Iterable, Dict, Callable
+from functools import partial, lru_cache
+from typing import Iterable, Dict, Callable, Optional, Any, Union
 
 import networkx
+import numpy
 import pandas
 
 from mlmq import OperatorType, DagNode, OperatorContext, DagNodeDetails, BasicCodeLocation
@@ -46,9 +48,9 @@ class CleaningMethod:
 
     method_name: str
     patch_type: PatchType
-    filter_func: Callable or None = None
-    fit_or_fit_transform_func: Callable or None = None
-    predict_or_fit_func: Callable or None = None
+    filter_func: Optional[Callable] = None
+    fit_or_fit_transform_func: Optional[Callable] = None
+    predict_or_fit_func: Optional[Callable] = None
     numeric_only: bool = False
     categorical_only: bool = False
 
@@ -56,20 +58,127 @@ class CleaningMethod:
         return hash(self.method_name)
 
 
+def _normalize_outlier_spec(outlier_func):
+    """Translate the outlier specification of a CleanLearn analysis into a hashable (kind, payload) pair"""
+    if isinstance(outlier_func, tuple) and len(outlier_func) == 2:
+        lower, upper = outlier_func
+        return "interval", (lower, upper)
+    if isinstance(outlier_func, numpy.ufunc):
+        return "ufunc", outlier_func
+    if callable(outlier_func):
+        return "callable", outlier_func
+    raise Exception("The outlier_func must be a (lower, upper) tuple, a numpy ufunc, or a callable returning a "
+                    "boolean mask!")
+
+
+def _compute_outlier_mask(column_values, outlier_spec):
+    """Evaluate the outlier predicate once and return it as a plain numpy boolean mask"""
+    outlier_kind, outlier_payload = outlier_spec
+    if outlier_kind == "interval":
+        # Values outside of the (lower, upper) interval are outliers
+        lower, upper = outlier_payload
+        raw_values = column_values.to_numpy()
+        return (raw_values < lower) | (raw_values > upper)
+    if outlier_kind == "ufunc":
+        return numpy.asarray(outlier_payload(column_values.to_numpy()), dtype=bool)
+    # Arbitrary callables get the pandas Series, like before
+    return numpy.asarray(outlier_payload(column_values), dtype=bool)
+
+
+def _outlier_mask_key(column, outlier_spec):
+    """The hashable description of an outlier mask, used as mask cache key"""
+    return "outlier", column, outlier_spec
+
+
+def _get_outlier_mask(input_df, column, outlier_spec):
+    """Get the outlier mask for a column, sharing it between all cleaning variants that read the same frame"""
+    return singleton.get_or_compute_mask(input_df, _outlier_mask_key(column, outlier_spec),
+                                         lambda df: _compute_outlier_mask(df[column], outlier_spec))
+
+
 def drop_outliers(input_df, column, outlier_func):
-    """Drop rows with missing values in that column"""
-    df_copy = input_df.copy()
-    indexes = df_copy[column].loc[outlier_func].index
-    result = df_copy.drop(indexes)
-    return result
+    """Drop rows with outliers in that column"""
+    return _drop_outliers(input_df, column, _normalize_outlier_spec(outlier_func))
 
 
 def impute_outliers(input_df, column, constant, outlier_func):
-    """Drop rows with missing values in that column"""
-    df_copy = input_df.copy()
-    indexes = df_copy[column].loc[outlier_func].index
-    df_copy.loc[indexes, column] = constant
-    return df_copy
+    """Replace outliers in that column with a constant"""
+    return _impute_outliers(input_df, column, constant, _normalize_outlier_spec(outlier_func))
+
+
+def _drop_outliers(input_df, column, outlier_spec):
+    """drop_outliers for an already normalized outlier specification"""
+    outlier_mask = _get_outlier_mask(input_df, column, outlier_spec)
+    return input_df[~outlier_mask]
+
+
+def _impute_outliers(input_df, column, constant, outlier_spec):
+    """impute_outliers for an already normalized outlier specification"""
+    column_values = input_df[column].to_numpy()
+    outlier_mask = _get_outlier_mask(input_df, column, outlier_spec)
+    imputed_values = numpy.where(outlier_mask, constant, column_values)
+    # Not DataFrame.assign, which only supports str column labels
+    result_df = input_df.copy()
+    result_df[column] = imputed_values
+    return result_df
+
+
+@lru_cache(maxsize=128, typed=True)
+def _make_filter_func(column, outlier_spec):
+    """Create the filter function once per column and outlier predicate, shared by all CleanLearn analyses"""
+    return partial(_drop_outliers, column=column, outlier_spec=outlier_spec)
+
+
+@lru_cache(maxsize=128, typed=True)
+def _make_impute_func(column, constant, outlier_spec):
+    """Create the impute function once per column, constant and outlier predicate"""
+    return partial(_impute_outliers, column=column, constant=constant, outlier_spec=outlier_spec)
+
+
+def _make_clean_dag_node(code_location_name, operator_type, description, processing_func):
+    """Create the DagNode that executes a cleaning function"""
+    return DagNode(singleton.get_next_op_id(),
+                   BasicCodeLocation(code_location_name, None),
+                   OperatorContext(operator_type, None),
+                   DagNodeDetails(description, None),
+                   None,
+                   processing_func)
+
+
+# id(dag) -> (weakref to dag, (node count, edge count), (predict operators, score operators, feature columns))
+_dag_introspection_cache = {}
+
+
+def _cached_introspect(dag: networkx.DiGraph):
+    """Find the predict and score operators and the feature columns of a DAG, reusing results across analyses"""
+    dag_key = id(dag)
+    dag_version = (dag.number_of_nodes(), dag.number_of_edges())
+    cache_entry = _dag_introspection_cache.get(dag_key)
+    if cache_entry is not None:
+        dag_ref, cached_dag_version, introspection_result = cache_entry
+        if dag_ref() is dag and cached_dag_version == dag_version:
+            return introspection_result
+    predict_operators = tuple(find_nodes_by_type(dag, OperatorType.PREDICT))
+    score_operators = tuple(find_nodes_by_type(dag, OperatorType.SCORE))
+    feature_cols = frozenset(get_columns_used_as_feature(dag))
+    introspection_result = (predict_operators, score_operators, feature_cols)
+    dag_ref = weakref.ref(dag, lambda _: _dag_introspection_cache.pop(dag_key, None))
+    _dag_introspection_cache[dag_key] = (dag_ref, dag_version, introspection_result)
+    return introspection_result
+
+
+@dataclasses.dataclass(frozen=True)
+class CleanLearnConfig:
+    """
+    The immutable configuration of a CleanLearn analysis, which also serves as its analysis_id
+    """
+
+    column: str
+    error: ErrorType
+    cleanings: tuple
+    impute_constant: Any
+    # A (lower, upper) tuple of valid values, a numpy ufunc, or a callable returning a boolean mask
+    outlier_func: Union[Callable, tuple]
 
 
 class CleanLearn(WhatIfAnalysis):
@@ -78,116 +187,107 @@ class CleanLearn(WhatIfAnalysis):
     """
 
     def __init__(self, column, error, cleanings, impute_constant, outlier_func):
-        self.column = column
-        self.error = error
-        self.cleanings = cleanings
+        self.config = CleanLearnConfig(column, error, tuple(cleanings), impute_constant, outlier_func)
+        # Translated once here, which also fails early for invalid outlier specifications
+        self._outlier_spec = _normalize_outlier_spec(outlier_func)
         self._score_nodes_and_linenos = []
-        self.impute_constant = impute_constant
-        self.outlier_func = outlier_func
-        self._analysis_id = (self.column, self.error, self.impute_constant, *self.cleanings,)
 
     @property
     def analysis_id(self):
-        return self._analysis_id
+        return self.config
 
     def generate_plans_to_try(self, dag: networkx.DiGraph) -> Iterable[Iterable[PipelinePatch]]:
         # pylint: disable=too-many-locals,too-many-branches,too-many-statements
-        predict_operators = find_nodes_by_type(dag, OperatorType.PREDICT)
+        predict_operators, score_operators, feature_cols = _cached_introspect(dag)
         if len(predict_operators) != 1:
             raise Exception("Currently, DataCorruption only supports pipelines with exactly one predict call which "
                             "must be on the test set!")
-        score_operators = find_nodes_by_type(dag, OperatorType.SCORE)
-        self._score_nodes_and_linenos = [(node, node.code_location.lineno) for node in score_operators]
-        if len(self._score_nodes_and_linenos) != len(set(self._score_nodes_and_linenos)):
-            raise Exception("Currently, DataCorruption only supports pipelines where different score operations can "
-                            "be uniquely identified by the line number in the code!")
-        if self.error != ErrorType.OUTLIER:
+        self._score_nodes_and_linenos = []
+        seen_score_linenos = set()
+        for node in score_operators:
+            lineno = node.code_location.lineno
+            if lineno in seen_score_linenos:
+                raise Exception("Currently, DataCorruption only supports pipelines where different score operations "
+                                "can be uniquely identified by the line number in the code!")
+            seen_score_linenos.add(lineno)
+            self._score_nodes_and_linenos.append((node, lineno))
+        if self.config.error != ErrorType.OUTLIER:
             raise Exception("Please use the actual DataCleaning analysis instead of this more simple one"
                             " for the running example!")
-        cleaning_patch_sets = []
-        for cleaning in self.cleanings:
-            if cleaning == Clean.FILTER:
-                cleaning_result_label = f"data-cleaning-{self.column}-{cleaning.value}"
-                patches_for_variant = []
-                extraction_nodes = get_intermediate_extraction_patch_after_score_nodes(singleton, self,
-                                                                                       cleaning_result_label,
-                                                                                       self._score_nodes_and_linenos)
-                patches_for_variant.extend(extraction_nodes)
-                feature_cols = set(get_columns_used_as_feature(dag))
-                if self.column in feature_cols:
-                    required_cols = list(feature_cols)
-                else:
-                    required_cols = [self.column]
-                filter_func = partial(drop_outliers, column=self.column, outlier_func=self.outlier_func)
-
-                new_test_cleaning_node = DagNode(singleton.get_next_op_id(),
-                                                  BasicCodeLocation("Data Cleaning", None),
-                                                  OperatorContext(OperatorType.SELECTION, None),
-                                                  DagNodeDetails(
-                                                      f"Clean {self.column}: filter", None),
-                                                  None,
-                                                  filter_func)
-                filter_patch_train = DataFiltering(singleton.get_next_patch_id(), self, True,
-                                                   new_test_cleaning_node, False, required_cols)
-                patches_for_variant.append(filter_patch_train)
-
-            elif cleaning == Clean.IMPUTE:
-                cleaning_result_label = f"data-cleaning-{self.column}-{cleaning.value}"
-                patches_for_variant = []
-                extraction_nodes = get_intermediate_extraction_patch_after_score_nodes(singleton, self,
-                                                                                       cleaning_result_label,
-                                                                                       self._score_nodes_and_linenos)
-                patches_for_variant.extend(extraction_nodes)
-                only_reads_column = [self.column]
-                projection = partial(impute_outliers, column=self.column, constant=self.impute_constant,
-                                     outlier_func=self.outlier_func)
-                new_projection_node = DagNode(singleton.get_next_op_id(),
-                                              BasicCodeLocation("DataCorruption", None),
-                                              OperatorContext(OperatorType.PROJECTION_MODIFY, None),
-                                              DagNodeDetails(f"Clean {self.column}: impute", None),
-                                              None,
-                                              projection)
-                patch = DataProjection(singleton.get_next_patch_id(), self, True, new_projection_node, False, self.column,
-                                       only_reads_column, None)
-                patches_for_variant.append(patch)
-            else:
+        column = self.config.column
+        if column in feature_cols:
+            required_cols_for_filter = list(feature_cols)
+        else:
+            required_cols_for_filter = [column]
+        score_nodes_and_linenos = self._score_nodes_and_linenos
+        cleaning_patch_builders = self._CLEANING_PATCH_BUILDERS
+        # Variants are yielded one by one, so they are only constructed when the executor asks for them
+        for cleaning in self.config.cleanings:
+            build_cleaning_patch = cleaning_patch_builders.get(cleaning)
+            if build_cleaning_patch is None:
                 raise Exception("Unknown cleaning. Please use the real, more complex DataCleaning what-if analysis.")
+            cleaning_result_label = f"data-cleaning-{column}-{cleaning.value}"
+            patches_for_variant = get_intermediate_extraction_patch_after_score_nodes(singleton, self,
+                                                                                      cleaning_result_label,
+                                                                                      score_nodes_and_linenos)
+            patches_for_variant.append(build_cleaning_patch(self, required_cols_for_filter))
+            yield patches_for_variant
 
-            cleaning_patch_sets.append(patches_for_variant)
-        return cleaning_patch_sets
+    def _build_filter_patch(self, required_cols_for_filter) -> PipelinePatch:
+        """Filter out the outliers on the test side"""
+        config = self.config
+        filter_func = _make_filter_func(config.column, self._outlier_spec)
+        new_test_cleaning_node = _make_clean_dag_node("Data Cleaning", OperatorType.SELECTION,
+                                                      f"Clean {config.column}: filter", filter_func)
+        return DataFiltering(singleton.get_next_patch_id(), self, True, new_test_cleaning_node, False,
+                             required_cols_for_filter)
+
+    def _build_impute_patch(self, _required_cols_for_filter) -> PipelinePatch:
+        """Replace the outliers on the test side with the impute constant"""
+        config = self.config
+        only_reads_column = [config.column]
+        projection = _make_impute_func(config.column, config.impute_constant, self._outlier_spec)
+        new_projection_node = _make_clean_dag_node("DataCorruption", OperatorType.PROJECTION_MODIFY,
+                                                   f"Clean {config.column}: impute", projection)
+        return DataProjection(singleton.get_next_patch_id(), self, True, new_projection_node, False, config.column,
+                              only_reads_column, None)
+
+    _CLEANING_PATCH_BUILDERS = {
+        Clean.FILTER: _build_filter_patch,
+        Clean.IMPUTE: _build_impute_patch,
+    }
 
     def generate_final_report(self, extracted_plan_results: Dict[str, any]) -> any:
         # pylint: disable=too-many-locals
-        result_df_columns = []
-        result_df_errors = []
-        result_df_cleaning_methods = []
-        result_df_metrics = {}
-        score_description_and_linenos = [(score_node.details.description, lineno)
-                                         for (score_node, lineno) in self._score_nodes_and_linenos]
-
-        result_df_columns.append(None)
-        result_df_errors.append(None)
-        result_df_cleaning_methods.append(None)
-        for (score_description, lineno) in score_description_and_linenos:
-            original_pipeline_result_label = f"original_L{lineno}"
-            test_result_column_name = f"{score_description}_L{lineno}"
-            test_column_values = result_df_metrics.get(test_result_column_name, [])
-            test_column_values.append(singleton.labels_to_extracted_plan_results[original_pipeline_result_label])
-            result_df_metrics[test_result_column_name] = test_column_values
-
-        for (column, error_type) in [(self.column, self.error)]:
-            for cleaning in self.cleanings:
-                result_df_columns.append(column)
-                result_df_errors.append(error_type.value)
-                result_df_cleaning_methods.append(cleaning.value)
-                for (score_description, lineno) in score_description_and_linenos:
-                    cleaning_result_label = f"data-cleaning-{column}-{cleaning.value}_L{lineno}"
-                    test_result_column_name = f"{score_description}_L{lineno}"
-                    test_column_values = result_df_metrics.get(test_result_column_name, [])
-                    test_column_values.append(singleton.labels_to_extracted_plan_results[cleaning_result_label])
-                    result_df_metrics[test_result_column_name] = test_column_values
+        plan_results = singleton.labels_to_extracted_plan_results
+        # (label suffix, report column name, original pipeline result label) for each score
+        score_labels = [(f"_L{lineno}", f"{score_node.details.description}_L{lineno}", f"original_L{lineno}")
+                        for (score_node, lineno) in self._score_nodes_and_linenos]
+        # The first row is the original pipeline, then one row per cleaning
+        n_rows = 1 + len(self.config.cleanings)
+        # numpy.empty with dtype object is filled with None, which is what the original pipeline row needs
+        result_df_columns = numpy.empty(n_rows, dtype=object)
+        result_df_errors = numpy.empty(n_rows, dtype=object)
+        result_df_cleaning_methods = numpy.empty(n_rows, dtype=object)
+        # One row per report row, one column per score. Scores are not always numbers, e.g., fairlearn MetricFrames
+        result_metrics = numpy.empty((n_rows, len(score_labels)), dtype=object)
+
+        for score_index, (_, _, original_pipeline_result_label) in enumerate(score_labels):
+            result_metrics[0, score_index] = plan_results[original_pipeline_result_label]
+
+        column = self.config.column
+        result_df_columns[1:] = column
+        result_df_errors[1:] = self.config.error.value
+        for row_index, cleaning in enumerate(self.config.cleanings, start=1):
+            result_df_cleaning_methods[row_index] = cleaning.value
+            label_prefix = f"data-cleaning-{column}-{cleaning.value}"
+            for score_index, (label_suffix, _, _) in enumerate(score_labels):
+                result_metrics[row_index, score_index] = plan_results[label_prefix + label_suffix]
         result_df = pandas.DataFrame({'corrupted_column': result_df_columns,
                                       'error': result_df_errors,
                                       'cleaning_method': result_df_cleaning_methods,
-                                      **result_df_metrics})
+                                      **{test_result_column_name: result_metrics[:, score_index]
+                                         for score_index, (_, test_result_column_name, _) in enumerate(score_labels)}})
+        # Numeric score columns get a numeric dtype again, like when pandas infers it from lists
+        result_df = result_df.infer_objects()
         return result_df
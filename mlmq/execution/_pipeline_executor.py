@@ -6,6 +6,7 @@ import ast
 import logging
 import sys
 import time
+import weakref
 from contextlib import redirect_stdout
 from io import StringIO
 from typing import List
@@ -57,6 +58,8 @@ class PipelineExecutor:
     # TODO: Do we want to add the analysis to the key next to label to isolate analyses and avoid name clashes?
     original_pipeline_labels_to_extracted_plan_results = dict()
     labels_to_extracted_plan_results = dict()
+    # (id(input_df), mask_key) -> (weakref to input_df, mask), see get_or_compute_mask
+    mask_cache = dict()
     analysis_results = AnalysisResults(dict(), networkx.DiGraph(), [], networkx.DiGraph(),
                                        RuntimeInfo(0, 0, 0, 0, None, None, 0, 0, 0, 0, 0, 0, 0),
                                        DagExtractionInfo(networkx.DiGraph(), dict(), 0, 0, 0), None)
@@ -224,6 +227,22 @@ class PipelineExecutor:
         self.next_patch_id += 1
         return current_patch_id
 
+    def get_or_compute_mask(self, input_df, mask_key, compute_mask):
+        """
+        Processing funcs can use this to compute masks with the same hashable mask_key only once per input
+        """
+        key = (id(input_df), mask_key)
+        cache_entry = self.mask_cache.get(key)
+        if cache_entry is not None:
+            input_df_ref, mask = cache_entry
+            if input_df_ref() is input_df:
+                return mask
+        mask = compute_mask(input_df)
+        mask_cache = self.mask_cache
+        input_df_ref = weakref.ref(input_df, lambda _: mask_cache.pop(key, None))
+        self.mask_cache[key] = (input_df_ref, mask)
+        return mask
+
     def get_next_missing_op_id(self):
         """
         Each unknown operator in the DAG gets a consecutive unique negative id
@@ -254,6 +273,7 @@ class PipelineExecutor:
         self.analyses = []
         self.original_pipeline_labels_to_extracted_plan_results = dict()
         self.labels_to_extracted_plan_results = dict()
+        self.mask_cache = dict()
         self.custom_monkey_patching = []
         self.monkey_patch_duration = 0
         self.skip_optimizer = False
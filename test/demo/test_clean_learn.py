@@ -0,0 +1,228 @@
+"""
+Tests whether the CleanLearn what-if analysis of the feature overview demo works
+"""
+import networkx
+import numpy
+import pandas
+import pytest
+
+from demo.feature_overview.clean_learn import drop_outliers, impute_outliers, CleanLearn, ErrorType, Clean, \
+    _normalize_outlier_spec, _compute_outlier_mask
+from mlmq import OperatorType, OperatorContext, DagNode, DagNodeDetails, BasicCodeLocation
+from mlmq.execution._patches import DataProjection
+from mlmq.execution._pipeline_executor import singleton
+
+
+def get_test_df():
+    """The test data with two outliers in the weight column and one missing value"""
+    return pandas.DataFrame({'weight': [10., 50., numpy.nan, 150., 80.], 'name': ['a', 'b', 'c', 'd', 'e']},
+                            index=[3, 4, 5, 6, 7])
+
+
+def test_drop_outliers_callable():
+    """
+    Tests whether drop_outliers works with a callable that gets the pandas Series
+    """
+    singleton.reset()
+    result = drop_outliers(get_test_df(), 'weight', lambda y: (y > 120) | (y < 30))
+
+    df_expected = pandas.DataFrame({'weight': [50., numpy.nan, 80.], 'name': ['b', 'c', 'e']}, index=[4, 5, 7])
+    pandas.testing.assert_frame_equal(result, df_expected)
+
+
+def test_impute_outliers_callable():
+    """
+    Tests whether impute_outliers works with a callable that gets the pandas Series
+    """
+    singleton.reset()
+    input_df = get_test_df()
+    result = impute_outliers(input_df, 'weight', 70, lambda y: (y > 120) | (y < 30))
+
+    df_expected = pandas.DataFrame({'weight': [70., 50., numpy.nan, 70., 80.], 'name': ['a', 'b', 'c', 'd', 'e']},
+                                   index=[3, 4, 5, 6, 7])
+    pandas.testing.assert_frame_equal(result, df_expected)
+    pandas.testing.assert_frame_equal(input_df, get_test_df())
+
+
+def test_impute_outliers_non_str_column():
+    """
+    Tests whether impute_outliers works for columns whose label is not a str
+    """
+    singleton.reset()
+    input_df = pandas.DataFrame({0: [10., 50., 150.], 1: ['a', 'b', 'c']})
+    result = impute_outliers(input_df, 0, 70, (30, 120))
+
+    df_expected = pandas.DataFrame({0: [70., 50., 70.], 1: ['a', 'b', 'c']})
+    pandas.testing.assert_frame_equal(result, df_expected)
+    pandas.testing.assert_frame_equal(input_df, pandas.DataFrame({0: [10., 50., 150.], 1: ['a', 'b', 'c']}))
+
+
+def test_drop_outliers_ufunc():
+    """
+    Tests whether drop_outliers works with a numpy ufunc that gets the raw column values
+    """
+    singleton.reset()
+    result = drop_outliers(get_test_df(), 'weight', numpy.isnan)
+
+    df_expected = pandas.DataFrame({'weight': [10., 50., 150., 80.], 'name': ['a', 'b', 'd', 'e']},
+                                   index=[3, 4, 6, 7])
+    pandas.testing.assert_frame_equal(result, df_expected)
+
+
+def test_impute_outliers_ufunc():
+    """
+    Tests whether impute_outliers works with a numpy ufunc that gets the raw column values
+    """
+    singleton.reset()
+    result = impute_outliers(get_test_df(), 'weight', 70, numpy.isnan)
+
+    df_expected = pandas.DataFrame({'weight': [10., 50., 70., 150., 80.], 'name': ['a', 'b', 'c', 'd', 'e']},
+                                   index=[3, 4, 5, 6, 7])
+    pandas.testing.assert_frame_equal(result, df_expected)
+
+
+def test_invalid_outlier_spec():
+    """
+    Tests whether invalid outlier specifications are rejected when the analysis is created
+    """
+    with pytest.raises(Exception, match="The outlier_func must be"):
+        _normalize_outlier_spec("weight > 120")
+    with pytest.raises(Exception, match="The outlier_func must be"):
+        _normalize_outlier_spec((30, 70, 120))
+    with pytest.raises(Exception, match="The outlier_func must be"):
+        CleanLearn("weight", ErrorType.OUTLIER, [Clean.FILTER, Clean.IMPUTE], 70, 120)
+
+
+def test_drop_outliers_interval():
+    """
+    Tests whether drop_outliers with a (lower, upper) interval matches the equivalent callable
+    """
+    singleton.reset()
+    result = drop_outliers(get_test_df(), 'weight', (30, 120))
+    result_callable = drop_outliers(get_test_df(), 'weight', lambda y: (y > 120) | (y < 30))
+
+    df_expected = pandas.DataFrame({'weight': [50., numpy.nan, 80.], 'name': ['b', 'c', 'e']}, index=[4, 5, 7])
+    pandas.testing.assert_frame_equal(result, df_expected)
+    pandas.testing.assert_frame_equal(result, result_callable)
+
+
+def test_impute_outliers_interval():
+    """
+    Tests whether impute_outliers with a (lower, upper) interval matches the equivalent callable
+    """
+    singleton.reset()
+    result = impute_outliers(get_test_df(), 'weight', 70, (30, 120))
+    result_callable = impute_outliers(get_test_df(), 'weight', 70, lambda y: (y > 120) | (y < 30))
+
+    df_expected = pandas.DataFrame({'weight': [70., 50., numpy.nan, 70., 80.], 'name': ['a', 'b', 'c', 'd', 'e']},
+                                   index=[3, 4, 5, 6, 7])
+    pandas.testing.assert_frame_equal(result, df_expected)
+    pandas.testing.assert_frame_equal(result, result_callable)
+
+
+def test_interval_outlier_mask():
+    """
+    Tests whether the interval outlier mask equals (values < lower) | (values > upper), NaN values included
+    """
+    column_values = numpy.random.default_rng(42).normal(75, 30, 10000)
+    column_values[::7] = numpy.nan
+    outlier_spec = _normalize_outlier_spec((30., 120.))
+    outlier_mask = _compute_outlier_mask(pandas.Series(column_values), outlier_spec)
+
+    numpy.testing.assert_array_equal(outlier_mask, (column_values < 30.) | (column_values > 120.))
+    assert not outlier_mask[::7].any()
+
+
+def get_test_dag(score_linenos, test_columns=('weight',)):
+    """A minimal DAG with test data, one predict call, and score calls in the given lines"""
+    dag = networkx.DiGraph()
+    test_data = DagNode(0, BasicCodeLocation("<string-source>", 3), OperatorContext(OperatorType.TEST_DATA, None),
+                        DagNodeDetails(None, list(test_columns)))
+    predict = DagNode(1, BasicCodeLocation("<string-source>", 4), OperatorContext(OperatorType.PREDICT, None),
+                      DagNodeDetails(None, ['array']))
+    dag.add_edge(test_data, predict, arg_index=0)
+    for node_id, lineno in enumerate(score_linenos, start=2):
+        score = DagNode(node_id, BasicCodeLocation("<string-source>", lineno),
+                        OperatorContext(OperatorType.SCORE, None), DagNodeDetails("accuracy_score", []))
+        dag.add_edge(predict, score, arg_index=0)
+    return dag
+
+
+def test_generate_plans_to_try():
+    """
+    Tests whether CleanLearn generates one variant per cleaning with an extraction patch per score
+    """
+    singleton.reset()
+    clean_learn = CleanLearn("weight", ErrorType.OUTLIER, [Clean.FILTER, Clean.IMPUTE], 70, (30, 120))
+    variants = list(clean_learn.generate_plans_to_try(get_test_dag([5, 6])))
+
+    assert len(variants) == 2
+    assert [len(patches) for patches in variants] == [3, 3]
+
+
+def test_generate_plans_to_try_interleaved():
+    """
+    Tests whether interleaved plan generation for different DAGs keeps the filter columns of each DAG
+    """
+    singleton.reset()
+    clean_learn = CleanLearn("weight", ErrorType.OUTLIER, [Clean.IMPUTE, Clean.FILTER], 70, (30, 120))
+    feature_variants = clean_learn.generate_plans_to_try(get_test_dag([5], ['weight', 'height']))
+    non_feature_variants = clean_learn.generate_plans_to_try(get_test_dag([5], ['height']))
+    feature_impute_variant = next(feature_variants)
+    non_feature_impute_variant = next(non_feature_variants)
+    feature_filter_variant = next(feature_variants)
+    non_feature_filter_variant = next(non_feature_variants)
+
+    assert isinstance(feature_impute_variant[-1], DataProjection)
+    assert isinstance(non_feature_impute_variant[-1], DataProjection)
+    assert sorted(feature_filter_variant[-1].only_reads_column) == ['height', 'weight']
+    assert non_feature_filter_variant[-1].only_reads_column == ['weight']
+
+
+def test_generate_plans_to_try_duplicate_score_linenos():
+    """
+    Tests whether CleanLearn rejects pipelines with multiple score calls in the same line
+    """
+    singleton.reset()
+    clean_learn = CleanLearn("weight", ErrorType.OUTLIER, [Clean.FILTER, Clean.IMPUTE], 70, (30, 120))
+    with pytest.raises(Exception, match="uniquely identified by the line number"):
+        list(clean_learn.generate_plans_to_try(get_test_dag([5, 5])))
+
+
+def get_test_report(score_results):
+    """Run generate_final_report for a FILTER and IMPUTE CleanLearn with the given results for the score in line 5"""
+    singleton.reset()
+    clean_learn = CleanLearn("weight", ErrorType.OUTLIER, [Clean.FILTER, Clean.IMPUTE], 70, (30, 120))
+    list(clean_learn.generate_plans_to_try(get_test_dag([5])))
+    original_result, filter_result, impute_result = score_results
+    singleton.labels_to_extracted_plan_results = {"original_L5": original_result,
+                                                  "data-cleaning-weight-filter_L5": filter_result,
+                                                  "data-cleaning-weight-impute_L5": impute_result}
+    return clean_learn.generate_final_report(singleton.labels_to_extracted_plan_results)
+
+
+def test_generate_final_report():
+    """
+    Tests whether the CleanLearn report has one row for the original pipeline and one row per cleaning
+    """
+    report = get_test_report([0.8, 0.9, 0.85])
+
+    expected_report = pandas.DataFrame({'corrupted_column': [None, 'weight', 'weight'],
+                                        'error': [None, 'outliers', 'outliers'],
+                                        'cleaning_method': [None, 'filter', 'impute'],
+                                        'accuracy_score_L5': [0.8, 0.9, 0.85]})
+    pandas.testing.assert_frame_equal(report, expected_report)
+
+
+def test_generate_final_report_non_float_scores():
+    """
+    Tests whether the CleanLearn report works for score results that are not floats, like fairlearn MetricFrames
+    """
+    score_results = [pandas.Series([0.8, 0.7], index=['female', 'male']),
+                     pandas.Series([0.9, 0.8], index=['female', 'male']),
+                     pandas.Series([0.85, 0.75], index=['female', 'male'])]
+    report = get_test_report(score_results)
+
+    assert report['accuracy_score_L5'].dtype == object
+    for report_result, score_result in zip(report['accuracy_score_L5'], score_results):
+        pandas.testing.assert_series_equal(report_result, score_result)
@@ -8,6 +8,8 @@ from types import FunctionType
 
 import astunparse
 import networkx
+import numpy
+import pandas
 from testfixtures import compare, Comparison, RangeComparison
 
 from mlmq import OperatorType, OperatorContext, FunctionInfo
@@ -251,3 +253,32 @@ def test_instrument_pipeline_without_code_reference_tracking():
             undo_monkey_patch()
             """)
     compare(cleandoc(instrumented_code), expected_code)
+
+
+def test_mask_cache():
+    """
+    Tests whether masks with the same mask_key are only computed once per input frame
+    """
+    singleton.reset()
+    test_df = pandas.DataFrame({'A': [0, 5, 10]})
+    other_df = pandas.DataFrame({'A': [0, 5, 10]})
+    computed_masks = []
+
+    def compute_mask(input_df):
+        mask = (input_df['A'] > 3).to_numpy()
+        computed_masks.append(mask)
+        return mask
+
+    first_mask = singleton.get_or_compute_mask(test_df, ("test", "A"), compute_mask)
+    second_mask = singleton.get_or_compute_mask(test_df, ("test", "A"), compute_mask)
+    assert second_mask is first_mask
+    assert len(computed_masks) == 1
+    compare(first_mask, numpy.array([False, True, True]))
+
+    singleton.get_or_compute_mask(other_df, ("test", "A"), compute_mask)
+    assert len(computed_masks) == 2
+
+    del other_df
+    assert len(singleton.mask_cache) == 1
+    singleton.reset()
+    assert len(singleton.mask_cache) == 0